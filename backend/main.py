@@ -1,32 +1,92 @@
 # main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Path, Query, BackgroundTasks, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from backend.services.utils import extract_text, chunk_text
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from cachetools import TTLCache
+from backend.services.utils import extract_text, chunk_text, file_extension, SUPPORTED_EXTENSIONS
 from backend.services.database import documents_collection, conversations_collection, users_collection
-from backend.services.vectorstore import collection, get_embedding
+from backend.services.vectorstore import (
+    collection, get_query_embedding, get_embeddings_async, mmr_select,
+    embedding_cache_info
+)
+from backend.services.semantic_cache import SemanticCache
 from backend.models.auth import (
     authenticate_user, create_access_token, get_current_user, 
     get_password_hash, UserCreate, UserLogin, Token, User,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 import google.generativeai as genai
+import asyncio
+import logging
+import shutil
+import numpy as np
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
-app = FastAPI(title="Knowledge Assistant with Authentication", version="2.0.0")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="Knowledge Assistant with Authentication",
+    version="2.0.0",
+    default_response_class=ORJSONResponse
+)
 
 # Configure Gemini
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 gemini_model = genai.GenerativeModel('gemini-2.0-flash-exp')
 
 UPLOAD_FOLDER = "uploads"
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "10485760"))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Dedicated pool for CPU-heavy text extraction, so large uploads don't starve
+# the default executor used for database and vector store calls
+extraction_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+# Content-Length covers the whole multipart body (boundaries, part headers),
+# so allow some headroom; save_and_extract enforces the exact file size
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads from Content-Length before the body is read.
+
+    Plain ASGI rather than @app.middleware("http"), so other routes (notably
+    /ask/stream) pass straight through without BaseHTTPMiddleware's wrapping.
+    """
+
+    def __init__(self, app, paths, max_body_size):
+        self.app = app
+        self.paths = paths
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_body_size:
+                response = ORJSONResponse(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    content={"detail": f"File exceeds the {MAX_FILE_SIZE} byte limit"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=("/upload", "/upload-chat"),
+    max_body_size=MAX_FILE_SIZE + MULTIPART_OVERHEAD
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,29 +94,95 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# MongoDB ObjectIds are 24 hex characters; malformed ids get a 422 without a DB hit
+OBJECT_ID_PATTERN = r"^[0-9a-fA-F]{24}$"
+
+# Chunks fetched from the vector store before MMR narrows them down
+RETRIEVAL_CANDIDATES = 10
+
+# Conversation turns fed into the prompt, and kept in MongoDB per user
+HISTORY_CONTEXT_TURNS = 10
+HISTORY_MAX_TURNS = 50
+
+PROMPT_TEMPLATE = """
+    You are a helpful assistant. Reference the uploaded documents and chats.
+    Past conversation: {memory_text}
+    Relevant content: {relevant_texts}
+    Question: {question}
+    Provide a concise answer with key takeaways.
+    """
+
+# Short-lived cache of /documents pages, keyed by (user_id, skip, limit)
+document_listing_cache = TTLCache(maxsize=256, ttl=30)
+
+# Answers to near-identical questions, per user
+semantic_cache = SemanticCache()
+
+def invalidate_user_caches(user_id):
+    """Drop cached /documents pages and answers after the user's documents change"""
+    for key in [k for k in document_listing_cache if k[0] == user_id]:
+        document_listing_cache.pop(key, None)
+    semantic_cache.invalidate(user_id)
+
 class Question(BaseModel):
     question: str
 
+def save_and_extract(source, file_path):
+    """Copy the spooled upload to disk, then extract text from the saved file"""
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(source, f)
+        size = f.tell()
+    # Chunked uploads carry no Content-Length, so the middleware cannot catch them
+    if size > MAX_FILE_SIZE:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {MAX_FILE_SIZE} byte limit"
+        )
+    return extract_text(file_path)
+
+async def store_chunks(chunks, chunk_ids, filename, doc_type, user_id):
+    """Embed all chunks concurrently and add them to the vector store in one call"""
+    embeddings, valid = await get_embeddings_async([chunk for _, _, chunk in chunks])
+    ids, documents, metadatas = [], [], []
+    for i in np.flatnonzero(valid):
+        start, end, chunk = chunks[i]
+        ids.append(chunk_ids[i])
+        documents.append(chunk)
+        metadatas.append({
+            "source": filename,
+            "chunk": int(i),
+            "start_char": start,
+            "end_char": end,
+            "type": doc_type,
+            "user_id": user_id
+        })
+    if documents:
+        await asyncio.to_thread(
+            collection.add,
+            documents=documents,
+            embeddings=embeddings[valid],
+            metadatas=metadatas,
+            ids=ids
+        )
+        # A delete that ran while indexing was in flight found no vectors to
+        # remove; drop them now so they are not orphaned in the vector store
+        still_exists = await asyncio.to_thread(
+            documents_collection.count_documents,
+            {"user_id": user_id, "chunk_ids": chunk_ids[0]},
+            limit=1
+        )
+        if not still_exists:
+            await asyncio.to_thread(collection.delete, ids=ids)
+            return
+        # Answers cached while indexing was in flight may miss the new chunks
+        semantic_cache.invalidate(user_id)
+
 # ==================== AUTHENTICATION ENDPOINTS ====================
 
 @app.post("/register", response_model=dict)
 async def register(user_data: UserCreate):
     """Register a new user"""
-    # Check if user already exists
-    existing_user = users_collection.find_one({"username": user_data.username})
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    existing_email = users_collection.find_one({"email": user_data.email})
-    if existing_email:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
     # Hash password and create user
     hashed_password = get_password_hash(user_data.password)
     user_doc = {
@@ -66,7 +192,16 @@ async def register(user_data: UserCreate):
         "created_at": datetime.utcnow()
     }
     
-    users_collection.insert_one(user_doc)
+    # Unique indexes on username/email reject duplicates on insert
+    try:
+        users_collection.insert_one(user_doc)
+    except DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        field = "Email" if "email" in key_pattern else "Username"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{field} already registered"
+        )
     
     return {"message": "User registered successfully"}
 
@@ -99,206 +234,301 @@ async def read_users_me(current_user = Depends(get_current_user)):
 
 # ==================== DOCUMENT MANAGEMENT ENDPOINTS ====================
 
-@app.post("/upload")
+@app.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     current_user = Depends(get_current_user)
 ):
     """Upload and process a document"""
-    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    contents = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    if file_extension(file.filename) not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported file type. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
+        )
 
-    # Extract text content
-    text = extract_text(file_path)
+    # Save the spooled upload and extract its text off the event loop. A unique
+    # server-side name keeps concurrent same-named uploads from overwriting each
+    # other and keeps client-supplied paths out of the upload folder
+    file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.{file_extension(file.filename)}")
+    text = await asyncio.get_running_loop().run_in_executor(
+        extraction_executor, save_and_extract, file.file, file_path
+    )
     
+    # Chunk ids are recorded with the metadata so deletes can target them
+    chunks = list(chunk_text(text))
+    chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+
     # Store document metadata in MongoDB
     doc_metadata = {
         "filename": file.filename,
         "text": text,
         "type": "document",
         "user_id": current_user["username"],
-        "upload_date": datetime.utcnow()
+        "upload_date": datetime.utcnow(),
+        "file_size": len(text.encode("utf-8")),
+        "chunk_ids": chunk_ids
     }
     documents_collection.insert_one(doc_metadata)
+    invalidate_user_caches(current_user["username"])
+
+    # Embed and store chunks in the vector database after responding
+    background_tasks.add_task(
+        store_chunks, chunks, chunk_ids, file.filename, "document", current_user["username"]
+    )
+
+    return {"message": f"{file.filename} uploaded successfully and is being indexed."}
 
-    # Create chunks and store in vector database
-    chunks = chunk_text(text)
-    for i, chunk in enumerate(chunks):
-        embedding = get_embedding(chunk)
-        if embedding:
-            collection.add(
-                documents=[chunk],
-                embeddings=[embedding],
-                metadatas=[{
-                    "source": file.filename, 
-                    "chunk": i, 
-                    "type": "document",
-                    "user_id": current_user["username"]
-                }],
-                ids=[str(uuid.uuid4())]
-            )
-
-    return {"message": f"{file.filename} uploaded and stored successfully."}
-
-@app.post("/upload-chat")
+@app.post("/upload-chat", status_code=status.HTTP_202_ACCEPTED)
 async def upload_chat(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     current_user = Depends(get_current_user)
 ):
     """Upload and process chat/conversation files"""
-    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    contents = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    if file_extension(file.filename) not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported file type. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
+        )
 
-    # Extract text content
-    text = extract_text(file_path)
+    # Save the spooled upload and extract its text off the event loop. A unique
+    # server-side name keeps concurrent same-named uploads from overwriting each
+    # other and keeps client-supplied paths out of the upload folder
+    file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}.{file_extension(file.filename)}")
+    text = await asyncio.get_running_loop().run_in_executor(
+        extraction_executor, save_and_extract, file.file, file_path
+    )
     
+    # Chunk ids are recorded with the metadata so deletes can target them
+    chunks = list(chunk_text(text))
+    chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+
     # Store chat metadata in MongoDB
     chat_metadata = {
         "filename": file.filename,
         "text": text,
         "type": "chat",
         "user_id": current_user["username"],
-        "upload_date": datetime.utcnow()
+        "upload_date": datetime.utcnow(),
+        "file_size": len(text.encode("utf-8")),
+        "chunk_ids": chunk_ids
     }
     documents_collection.insert_one(chat_metadata)
+    invalidate_user_caches(current_user["username"])
+
+    # Embed and store chunks in the vector database after responding
+    background_tasks.add_task(
+        store_chunks, chunks, chunk_ids, file.filename, "chat", current_user["username"]
+    )
 
-    # Create chunks and store in vector database
-    chunks = chunk_text(text)
-    for i, chunk in enumerate(chunks):
-        embedding = get_embedding(chunk)
-        if embedding:
-            collection.add(
-                documents=[chunk],
-                embeddings=[embedding],
-                metadatas=[{
-                    "source": file.filename, 
-                    "chunk": i, 
-                    "type": "chat",
-                    "user_id": current_user["username"]
-                }],
-                ids=[str(uuid.uuid4())]
-            )
-
-    return {"message": f"{file.filename} chat uploaded and stored successfully."}
+    return {"message": f"{file.filename} chat uploaded successfully and is being indexed."}
 
 # ==================== QUESTION ANSWERING ENDPOINT ====================
 
-@app.post("/ask")
-async def ask_question(
-    q: Question, 
-    current_user = Depends(get_current_user)
-):
-    """Ask a question and get AI-powered answer based on user's documents"""
-    # Get embedding for the question
-    query_embedding = get_embedding(q.question)
+async def embed_question(question):
+    """Get the embedding for a question, failing the request if it can't be made"""
+    query_embedding = await get_query_embedding(question)
     if not query_embedding:
         raise HTTPException(status_code=500, detail="Failed to generate embedding for query")
-    
-    # Retrieve top 3 relevant chunks using vector similarity
+    return query_embedding
+
+def retrieve_context(user_id, query_embedding):
+    """Fetch the most relevant, diverse chunks of the user's documents"""
+    # Retrieve top candidates by vector similarity, then keep 3 diverse ones (MMR)
     results = collection.query(
         query_embeddings=[query_embedding], 
-        n_results=3,
-        where={"user_id": current_user["username"]}  # Filter by user
+        n_results=RETRIEVAL_CANDIDATES,
+        where={"user_id": user_id},  # Filter by user
+        include=["documents", "embeddings"]
+    )
+    candidates = results['documents'][0] if results['documents'] else []
+    if not candidates:
+        return ""
+    picks = mmr_select(query_embedding, results['embeddings'][0], k=3)
+    return " ".join(candidates[i] for i in picks)
+
+def load_history(user_id):
+    """Fetch the user's recent conversation history"""
+    past_conv = conversations_collection.find_one(
+        {"user_id": user_id},
+        {"history": {"$slice": -HISTORY_CONTEXT_TURNS}}
+    )
+    return "\n".join(past_conv.get("history", [])) if past_conv else ""
+
+async def build_prompt(question, user_id, query_embedding):
+    """Retrieve relevant chunks and conversation history and build the AI prompt"""
+    # Vector search and history lookup are independent, so run them concurrently
+    relevant_texts, memory_text = await asyncio.gather(
+        asyncio.to_thread(retrieve_context, user_id, query_embedding),
+        asyncio.to_thread(load_history, user_id)
     )
-    relevant_texts = " ".join([doc for doc in results['documents'][0]]) if results['documents'] else ""
-
-    # Retrieve past conversation history for context
-    past_conv = conversations_collection.find_one({
-        "user_id": current_user["username"]
-    })
-    memory_text = "\n".join(past_conv.get("history", [])) if past_conv else ""
 
     # Create prompt for AI
-    prompt = f"""
-    You are a helpful assistant. Reference the uploaded documents and chats.
-    Past conversation: {memory_text}
-    Relevant content: {relevant_texts}
-    Question: {q.question}
-    Provide a concise answer with key takeaways.
-    """
+    return PROMPT_TEMPLATE.format(
+        memory_text=memory_text, relevant_texts=relevant_texts, question=question
+    )
+
+def save_conversation(user_id, question, answer):
+    """Append a question/answer pair to the user's conversation memory"""
+    conversation_entry = f"Q: {question}\nA: {answer}"
+    # Single atomic upsert instead of the old find_one -> insert_one round-trip
+    conversations_collection.update_one(
+        {"user_id": user_id},
+        {
+            "$push": {"history": {"$each": [conversation_entry], "$slice": -HISTORY_MAX_TURNS}},
+            "$setOnInsert": {"created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
 
-    # Get response from AI (Gemini)
-    response = gemini_model.generate_content(prompt)
-    answer = response.text
+@app.post("/ask")
+async def ask_question(
+    q: Question, 
+    current_user = Depends(get_current_user)
+):
+    """Ask a question and get AI-powered answer based on user's documents"""
+    user_id = current_user["username"]
+    query_embedding = await embed_question(q.question)
+
+    # Near-identical questions skip retrieval and generation entirely
+    generation = semantic_cache.generation(user_id)
+    answer = semantic_cache.lookup(user_id, query_embedding)
+    if answer is None:
+        prompt = await build_prompt(q.question, user_id, query_embedding)
+
+        # Get response from AI (Gemini) without blocking the event loop
+        response = await gemini_model.generate_content_async(prompt)
+        answer = response.text
+        semantic_cache.store(user_id, query_embedding, answer, generation)
 
     # Save conversation to memory
-    conversation_entry = f"Q: {q.question}\nA: {answer}"
-    if past_conv:
-        conversations_collection.update_one(
-            {"user_id": current_user["username"]},
-            {"$push": {"history": conversation_entry}}
-        )
-    else:
-        conversations_collection.insert_one({
-            "user_id": current_user["username"], 
-            "history": [conversation_entry],
-            "created_at": datetime.utcnow()
-        })
+    await asyncio.to_thread(save_conversation, user_id, q.question, answer)
 
     return {"answer": answer}
 
+@app.post("/ask/stream")
+async def ask_question_stream(
+    q: Question, 
+    current_user = Depends(get_current_user)
+):
+    """Ask a question and stream the AI answer as it is generated"""
+    query_embedding = await embed_question(q.question)
+    prompt = await build_prompt(q.question, current_user["username"], query_embedding)
+    response = await gemini_model.generate_content_async(prompt, stream=True)
+
+    async def generate():
+        parts = []
+        async for chunk in response:
+            parts.append(chunk.text)
+            yield chunk.text
+        # Save the full answer once the stream completes
+        await asyncio.to_thread(
+            save_conversation, current_user["username"], q.question, "".join(parts)
+        )
+
+    return StreamingResponse(generate(), media_type="text/plain")
+
 # ==================== DOCUMENT LISTING ENDPOINT ====================
 
 @app.get("/documents")
-async def list_documents(current_user = Depends(get_current_user)):
-    """List all documents for the current user"""
-    docs_cursor = documents_collection.find(
-        {"user_id": current_user["username"]}, 
-        {"filename": 1, "type": 1, "upload_date": 1, "text": 1}
-    )
+async def list_documents(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user = Depends(get_current_user)
+):
+    """List documents for the current user, newest first"""
+    cache_key = (current_user["username"], skip, limit)
+    cached = document_listing_cache.get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+
+    # Page before projecting so size/preview are only computed for returned docs;
+    # without a limit the full list is returned, as the frontend expects
+    page = [{"$skip": skip}] + ([{"$limit": limit}] if limit is not None else [])
+    # Preview and size are computed server-side so the full text never leaves MongoDB
+    docs_cursor = documents_collection.aggregate([
+        {"$match": {"user_id": current_user["username"]}},
+        {"$sort": {"upload_date": -1}},
+        *page,
+        {"$project": {
+            "filename": 1,
+            "type": 1,
+            "upload_date": 1,
+            "file_size": {"$ifNull": ["$file_size", {"$strLenBytes": "$text"}]},
+            "content_preview": {
+                "$cond": [
+                    {"$gt": [{"$strLenCP": "$text"}, 200]},
+                    {"$concat": [{"$substrCP": ["$text", 0, 200]}, "..."]},
+                    "$text"
+                ]
+            }
+        }}
+    ])
     docs = []
     for doc in docs_cursor:
-        # Calculate file size from text length (approximate)
-        text_content = doc.get("text", "")
-        file_size = len(text_content.encode('utf-8'))
-        
         docs.append({
             "id": str(doc["_id"]),
             "filename": doc["filename"],
             "type": doc["type"],
-            "upload_date": doc["upload_date"].isoformat(),
-            "file_size": file_size,
-            "content_preview": text_content[:200] + "..." if len(text_content) > 200 else text_content
+            "upload_date": doc["upload_date"],
+            "file_size": doc["file_size"],
+            "content_preview": doc["content_preview"]
         })
     
-    return docs
+    document_listing_cache[cache_key] = docs
+    # Plain dicts go straight to orjson, skipping FastAPI's jsonable_encoder pass
+    return ORJSONResponse(docs)
 
 @app.delete("/documents/{document_id}")
 async def delete_document(
-    document_id: str, 
+    document_id: str = Path(..., pattern=OBJECT_ID_PATTERN), 
     current_user = Depends(get_current_user)
 ):
     """Delete a document for the current user"""
-    from bson import ObjectId
-    
     # Verify document belongs to user and delete
-    result = documents_collection.delete_one({
-        "_id": ObjectId(document_id),
-        "user_id": current_user["username"]
-    })
+    doc = documents_collection.find_one_and_delete(
+        {"_id": ObjectId(document_id), "user_id": current_user["username"]},
+        projection={"filename": 1, "chunk_ids": 1}
+    )
     
-    if result.deleted_count == 0:
+    if doc is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found or not authorized"
         )
+    invalidate_user_caches(current_user["username"])
     
-    # Also remove vector embeddings for this document
-    # Note: This is a basic implementation - in production you'd want more sophisticated cleanup
+    # Also remove this document's vector embeddings
     try:
-        collection.delete(
-            where={"source": {"$ne": None}, "user_id": current_user["username"]}
-        )
+        if doc.get("chunk_ids"):
+            collection.delete(ids=doc["chunk_ids"])
+        else:
+            # Documents uploaded before chunk ids were recorded
+            collection.delete(where={"$and": [
+                {"source": doc["filename"]},
+                {"user_id": current_user["username"]}
+            ]})
     except Exception as e:
         # Log error but don't fail the deletion
-        print(f"Warning: Could not clean up vector embeddings: {e}")
+        logger.warning("Could not clean up vector embeddings: %s", e)
     
     return {"message": "Document deleted successfully"}
 
+# ==================== CACHE STATS ====================
+
+@app.get("/stats/cache")
+async def cache_stats(current_user = Depends(get_current_user)):
+    """Report hit rates and occupancy of the in-process caches"""
+    return {
+        "query_embeddings": embedding_cache_info(),
+        "semantic_answers": semantic_cache.info(),
+        "document_listings": {
+            "size": len(document_listing_cache),
+            "maxsize": document_listing_cache.maxsize
+        }
+    }
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/")
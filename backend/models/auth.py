@@ -1,7 +1,10 @@
 # auth.py
 from datetime import datetime, timedelta
 from typing import Optional
+import threading
+import time
 import jwt
+from cachetools import TTLCache
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -20,6 +23,12 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 security = HTTPBearer()
 
+# Short-lived caches so authenticated requests skip the JWT decode and user lookup
+AUTH_CACHE_TTL_SECONDS = 60
+_user_cache = TTLCache(maxsize=10_000, ttl=AUTH_CACHE_TTL_SECONDS)
+_token_cache = TTLCache(maxsize=10_000, ttl=AUTH_CACHE_TTL_SECONDS)
+_cache_lock = threading.Lock()
+
 # Pydantic models
 class UserCreate(BaseModel):
     username: str
@@ -48,10 +57,28 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 def get_user(username: str):
-    """Get user from database"""
-    user = users_collection.find_one({"username": username})
+    """Get user from database, served from a TTL cache when possible"""
+    with _cache_lock:
+        user = _user_cache.get(username)
+    if user is None:
+        user = users_collection.find_one({"username": username})
+        if user is not None:
+            with _cache_lock:
+                _user_cache[username] = user
     return user
 
+def decode_token(token: str):
+    """Decode a JWT, reusing the payload of recently seen tokens"""
+    with _cache_lock:
+        payload = _token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with _cache_lock:
+            _token_cache[token] = payload
+    elif payload.get("exp", 0) <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
 def authenticate_user(username: str, password: str):
     """Authenticate user credentials"""
     user = get_user(username)
@@ -75,7 +102,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verify JWT token and return current user"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(credentials.credentials)
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(
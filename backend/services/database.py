@@ -6,9 +6,25 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+
+# Size the connection pool for concurrent requests; sync endpoints run in
+# FastAPI's threadpool (40 threads by default), so keep headroom above that
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "5")),
+    maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+)
 db = client['knowledge_db']
 
 documents_collection = db['documents']          # store metadata + text
 conversations_collection = db['conversations']  # store user conversation history
-users_collection = db['users']                  # store user authentication data
\ No newline at end of file
+users_collection = db['users']                  # store user authentication data
+
+# Enforce uniqueness server-side so registration needs a single insert
+users_collection.create_index("username", unique=True)
+users_collection.create_index("email", unique=True)
+
+# Indexes for the per-user queries behind /documents and /ask
+documents_collection.create_index([("user_id", 1), ("upload_date", -1)])
+conversations_collection.create_index("user_id")
\ No newline at end of file
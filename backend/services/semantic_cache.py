@@ -0,0 +1,71 @@
+# semantic_cache.py
+import itertools
+import threading
+import numpy as np
+from cachetools import LRUCache
+
+class SemanticCache:
+    """Per-user answer cache matched by cosine similarity of question embeddings"""
+
+    def __init__(self, threshold=0.95, max_users=1024, max_entries=64):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._users = LRUCache(maxsize=max_users)  # user_id -> (vectors, answers)
+        # user_id -> token bumped on every invalidate, so answers computed
+        # against a user's old documents can be told apart from fresh ones
+        self._generations = LRUCache(maxsize=max_users * 4)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        # vdot skips np.linalg.norm's dispatch overhead on a single vector
+        return vector / max(np.sqrt(np.vdot(vector, vector)), 1e-12)
+
+    def generation(self, user_id):
+        """Token to pass to ``store`` for an answer computed from now on"""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def lookup(self, user_id, embedding):
+        """Return the cached answer for a near-identical question, or None"""
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        vectors, answers = entry
+        scores = vectors @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        return answers[best] if scores[best] >= self.threshold else None
+
+    def store(self, user_id, embedding, answer, generation):
+        """Remember an answer, keeping only the user's most recent entries.
+
+        The write is dropped if the user was invalidated after ``generation``
+        was taken, since the answer may not reflect their current documents.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            vectors, answers = self._users.get(
+                user_id, (np.empty((0, vector.shape[0]), dtype=np.float32), [])
+            )
+            vectors = np.vstack([vectors, vector])[-self.max_entries:]
+            answers = (answers + [answer])[-self.max_entries:]
+            self._users[user_id] = (vectors, answers)
+
+    def invalidate(self, user_id):
+        """Forget a user's answers, e.g. after their documents change"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._generations[user_id] = next(self._counter)
+
+    def info(self):
+        """Occupancy of the cache"""
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "entries": sum(len(answers) for _, answers in self._users.values())
+            }
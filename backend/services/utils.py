@@ -1,42 +1,82 @@
 # utils.py
-import PyPDF2
+import fitz  # PyMuPDF
 from docx import Document
-import json
+import orjson
+import os
+import re
+import threading
 
-def extract_text(file_path):
-    """Extract text from various file formats"""
-    if file_path.endswith(".pdf"):
-        text = ""
-        with open(file_path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() or ""
+def _message_text(msg):
+    """Flatten a chat message's text, which may be a string or a list of parts"""
+    text = msg.get("text")
+    if isinstance(text, str):
         return text
-    elif file_path.endswith(".docx"):
-        doc = Document(file_path)
-        return "\n".join([p.text for p in doc.paragraphs])
-    elif file_path.endswith(".txt"):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-    elif file_path.endswith(".json"):
-        # Instagram chat JSON or other JSON formats
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            messages = []
-            for msg in data.get("messages", []):
-                text = msg.get("text")
-                if isinstance(text, str):
-                    messages.append(text)
-                elif isinstance(text, list):
-                    messages.append(" ".join([t.get("text","") for t in text if isinstance(t, dict)]))
-            return "\n".join(messages)
-    else:
-        return ""
-
-def chunk_text(text, chunk_size=500):
-    """Split text into smaller chunks for vector storage"""
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size):
-        chunks.append(" ".join(words[i:i+chunk_size]))
-    return chunks
\ No newline at end of file
+    if isinstance(text, list):
+        return " ".join(t.get("text", "") for t in text if isinstance(t, dict))
+    return None
+
+# MuPDF is not thread-safe, even across separate documents, so PDF extraction is
+# serialized while DOCX/TXT/JSON still use the whole extraction pool
+_pdf_lock = threading.Lock()
+
+def _extract_pdf(file_path):
+    # PyMuPDF reads pages from the file on demand instead of a full in-memory copy
+    with _pdf_lock, fitz.open(file_path) as pdf:
+        return "".join(page.get_text("text") for page in pdf)
+
+def _extract_docx(file_path):
+    doc = Document(file_path)
+    return "\n".join([p.text for p in doc.paragraphs])
+
+def _extract_txt(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _extract_json(file_path):
+    # Instagram chat JSON or other JSON formats
+    with open(file_path, "rb") as f:
+        data = orjson.loads(f.read())
+    return "\n".join(filter(None, map(_message_text, data.get("messages", ()))))
+
+_EXTRACTORS = {
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "txt": _extract_txt,
+    "json": _extract_json,
+}
+
+SUPPORTED_EXTENSIONS = frozenset(_EXTRACTORS)
+
+def file_extension(filename):
+    """Lower-cased extension without the dot ("" for dotless names)"""
+    return os.path.splitext(filename)[1][1:].lower()
+
+def extract_text(file_path):
+    """Extract text from a saved file, dispatching on its suffix"""
+    extractor = _EXTRACTORS.get(file_extension(file_path))
+    return extractor(file_path) if extractor else ""
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+# Greedy match from a window's midpoint to its last sentence/word boundary
+_LAST_BOUNDARY = re.compile(r"[\s\S]*[.\s]")
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping character windows for vector storage.
+
+    Windows end on the last boundary in their second half when there is one.
+    Yields ``(start_char, end_char, chunk)`` tuples in a single pass.
+    """
+    length = len(text)
+    start = 0
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            match = _LAST_BOUNDARY.match(text, start + chunk_size // 2, end)
+            if match:
+                end = match.end()
+        yield start, end, text[start:end]
+        if end == length:
+            break
+        start = max(end - overlap, start + 1)
\ No newline at end of file
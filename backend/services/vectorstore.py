@@ -1,31 +1,263 @@
 # vectorstore.py
+import asyncio
+import hashlib
+import logging
+import threading
 import chromadb
-import google.generativeai as genai
+import httpx
+import numpy as np
 import os
+from cachetools import LRUCache
 from dotenv import load_dotenv
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+logger = logging.getLogger(__name__)
+
+EMBED_MODEL = "models/text-embedding-004"
+
+# Optional Redis cache so embeddings survive restarts and are shared by workers
+REDIS_URL = os.getenv("REDIS_URL")
+SHARED_EMBEDDING_CACHE_TTL_SECONDS = 7 * 24 * 3600
+redis_client = redis.Redis.from_url(REDIS_URL) if redis and REDIS_URL else None
+
+# Memoize embeddings of repeated texts (mostly repeated questions in /ask).
+# Entries are float16 arrays: ~1.5 KB per 768-d vector instead of ~24 KB as a list
+_embedding_cache = LRUCache(maxsize=4096)
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_stats = {"hits": 0, "misses": 0}
 
-# Use Gemini for embeddings
-def get_embedding(text):
+def embedding_cache_info():
+    """Hit/miss counters and occupancy of the embedding cache"""
+    with _embedding_cache_lock:
+        return {
+            **_embedding_cache_stats,
+            "size": len(_embedding_cache),
+            "maxsize": _embedding_cache.maxsize
+        }
+
+def _shared_cache_key(key):
+    # Include the model so swapping models never serves stale vectors
+    return f"emb:{EMBED_MODEL}:{key}"
+
+def _get_shared_embedding(key):
+    """Look up an embedding in the Redis cache shared across workers"""
+    if redis_client is None:
+        return None
     try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text,
-            task_type="retrieval_document"
-        )
-        return result["embedding"]
-    except Exception as e:
-        print(f"Embedding error: {e}")
+        data = redis_client.get(_shared_cache_key(key))
+    except redis.RedisError as e:
+        logger.warning("Embedding cache error: %s", e)
         return None
+    if data is None:
+        return None
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist()
+
+def _put_shared_embedding(key, embedding):
+    """Store an embedding in Redis as float16 bytes"""
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(
+            _shared_cache_key(key),
+            SHARED_EMBEDDING_CACHE_TTL_SECONDS,
+            np.asarray(embedding, dtype=np.float16).tobytes()
+        )
+    except redis.RedisError as e:
+        logger.warning("Embedding cache error: %s", e)
+
+# Gemini caps the number of texts per batch embedding request
+EMBED_BATCH_SIZE = 100
+EMBED_URL = f"https://generativelanguage.googleapis.com/v1beta/{EMBED_MODEL}:batchEmbedContents"
+
+# Shared HTTP/2 client so concurrent embedding calls reuse connections
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+)
+# Separate permits so large uploads never queue question embeddings behind them
+embed_semaphore = asyncio.Semaphore(16)
+query_embed_semaphore = asyncio.Semaphore(8)
+
+async def _embed_batch_async(texts, semaphore):
+    """Embed one batch of texts with a single REST call, holding a ``semaphore`` permit.
+
+    Returns an (n, D) float32 matrix, or None if the request failed.
+    """
+    payload = {
+        "requests": [
+            {
+                "model": EMBED_MODEL,
+                "content": {"parts": [{"text": text}]},
+                "taskType": "RETRIEVAL_DOCUMENT"
+            }
+            for text in texts
+        ]
+    }
+    async with semaphore:
+        try:
+            response = await http_client.post(
+                EMBED_URL,
+                json=payload,
+                headers={"x-goog-api-key": os.getenv("GEMINI_API_KEY", "")}
+            )
+            response.raise_for_status()
+            # One contiguous float32 block instead of lists of Python floats,
+            # L2-normalized once so cosine similarity downstream is a bare dot product
+            embeddings = np.asarray(
+                [e["values"] for e in response.json()["embeddings"]],
+                dtype=np.float32
+            )
+            if len(embeddings) != len(texts):
+                raise ValueError(f"expected {len(texts)} embeddings, got {len(embeddings)}")
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            return embeddings
+        except Exception as e:
+            logger.warning("Embedding error: %s", e)
+            return None
+
+async def get_embeddings_async(texts):
+    """Embed a list of texts, running the batch requests concurrently.
+
+    Returns ``(matrix, valid)``: an (N, D) float32 matrix aligned with ``texts``
+    and a boolean mask that is False for rows of a failed batch.
+    """
+    starts = range(0, len(texts), EMBED_BATCH_SIZE)
+    results = await asyncio.gather(
+        *(_embed_batch_async(texts[i:i + EMBED_BATCH_SIZE], embed_semaphore) for i in starts)
+    )
+    dim = next((batch.shape[1] for batch in results if batch is not None), 0)
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    valid = np.zeros(len(texts), dtype=bool)
+    for i, batch in zip(starts, results):
+        if batch is not None:
+            matrix[i:i + len(batch)] = batch
+            valid[i:i + len(batch)] = True
+    return matrix, valid
+
+class EmbeddingBatcher:
+    """Coalesce concurrent single-text embedding requests into batch calls.
+
+    Requests arriving within ``max_wait`` seconds of each other (up to
+    ``max_batch`` of them) share one batchEmbedContents round-trip.
+    """
+
+    def __init__(self, max_batch=32, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._worker = None
+        self._dispatches = set()
+
+    async def embed(self, text):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting so the next batch can start collecting
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            embeddings = await _embed_batch_async(
+                [text for text, _ in batch], query_embed_semaphore
+            )
+        except Exception as e:
+            logger.warning("Embedding batch dispatch failed: %s", e)
+            embeddings = None
+        # Resolve every caller, even on failure, so none of them waits forever
+        for i, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(None if embeddings is None else embeddings[i])
+
+query_batcher = EmbeddingBatcher()
+
+async def get_query_embedding(query):
+    """Embed a search query, normalized so trivially different repeats share a cache entry.
+
+    Checks the in-process LRU, then Redis, then embeds through the batcher.
+    Returns None if the embedding could not be generated.
+    """
+    text = query.strip().lower()
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _embedding_cache_lock:
+        cached = _embedding_cache.get(key)
+        _embedding_cache_stats["hits" if cached is not None else "misses"] += 1
+    if cached is not None:
+        return cached.astype(np.float32).tolist()
+    # Only hop to a thread when there is a Redis server to talk to
+    embedding = None
+    if redis_client is not None:
+        embedding = await asyncio.to_thread(_get_shared_embedding, key)
+    if embedding is None:
+        embedding = await query_batcher.embed(text)
+        if embedding is None:
+            return None
+        embedding = embedding.tolist()
+        if redis_client is not None:
+            await asyncio.to_thread(_put_shared_embedding, key, embedding)
+    with _embedding_cache_lock:
+        _embedding_cache[key] = np.asarray(embedding, dtype=np.float16)
+    return embedding
+
+def mmr_select(query_embedding, embeddings, k=3, lambda_mult=0.5):
+    """Pick k diverse, relevant candidates with maximal marginal relevance.
+
+    Expects unit-length vectors, as produced by the embedding helpers above.
+    Returns indices into ``embeddings`` in selection order.
+    """
+    embs = np.asarray(embeddings, dtype=np.float32)
+    if len(embs) <= k:
+        return list(range(len(embs)))
+    query = np.asarray(query_embedding, dtype=np.float32)
+
+    relevance = embs @ query
+    similarity = embs @ embs.T
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
 
 # Initialize ChromaDB client
 client = chromadb.PersistentClient(path="./chroma_db")
 
-# Create or get collection for documents
+# Create or get collection for documents, indexed by cosine distance.
+# search_ef must comfortably exceed the 10 candidates /ask retrieves for MMR.
 collection = client.get_or_create_collection(
-    name="documents"
+    name="documents",
+    metadata={
+        "hnsw:space": "cosine",
+        "hnsw:M": 32,
+        "hnsw:construction_ef": 200,
+        "hnsw:search_ef": 64
+    }
 )
\ No newline at end of file
@@ -0,0 +1 @@
+# tests package
\ No newline at end of file
@@ -0,0 +1 @@
+# services tests
\ No newline at end of file
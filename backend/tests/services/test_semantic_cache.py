@@ -0,0 +1,46 @@
+# test_semantic_cache.py
+import numpy as np
+from backend.services.semantic_cache import SemanticCache
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_lookup_matches_near_identical_question():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("alice", unit(1, 0, 0), "answer", cache.generation("alice"))
+    assert cache.lookup("alice", unit(1, 0.05, 0)) == "answer"
+
+def test_lookup_misses_below_threshold():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("alice", unit(1, 0, 0), "answer", cache.generation("alice"))
+    assert cache.lookup("alice", unit(1, 1, 0)) is None
+
+def test_entries_are_per_user():
+    cache = SemanticCache()
+    cache.store("alice", unit(1, 0, 0), "answer", cache.generation("alice"))
+    assert cache.lookup("bob", unit(1, 0, 0)) is None
+
+def test_keeps_only_most_recent_entries():
+    cache = SemanticCache(max_entries=2)
+    for i, vector in enumerate([unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)]):
+        cache.store("alice", vector, f"answer {i}", cache.generation("alice"))
+    assert cache.lookup("alice", unit(1, 0, 0)) is None
+    assert cache.lookup("alice", unit(0, 0, 1)) == "answer 2"
+    assert cache.info() == {"users": 1, "entries": 2}
+
+def test_invalidate_drops_answers():
+    cache = SemanticCache()
+    cache.store("alice", unit(1, 0, 0), "answer", cache.generation("alice"))
+    cache.invalidate("alice")
+    assert cache.lookup("alice", unit(1, 0, 0)) is None
+
+def test_store_drops_answer_computed_before_invalidate():
+    cache = SemanticCache()
+    generation = cache.generation("alice")
+    cache.invalidate("alice")  # e.g. indexing finished while the answer was generated
+    cache.store("alice", unit(1, 0, 0), "stale", generation)
+    assert cache.lookup("alice", unit(1, 0, 0)) is None
+
+    cache.store("alice", unit(1, 0, 0), "fresh", cache.generation("alice"))
+    assert cache.lookup("alice", unit(1, 0, 0)) == "fresh"
\ No newline at end of file
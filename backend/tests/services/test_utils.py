@@ -0,0 +1,37 @@
+# test_utils.py
+from backend.services.utils import chunk_text, file_extension
+
+def test_chunks_cover_text_with_offsets():
+    text = "word " * 500
+    chunks = list(chunk_text(text, chunk_size=100, overlap=20))
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(text)
+    for start, end, chunk in chunks:
+        assert chunk == text[start:end]
+        assert len(chunk) <= 100
+
+def test_chunks_overlap():
+    text = "word " * 500
+    chunks = list(chunk_text(text, chunk_size=100, overlap=20))
+    for (_, prev_end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start == prev_end - 20
+
+def test_chunk_ends_snap_to_last_boundary():
+    text = "aaaa. bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb"
+    start, end, chunk = next(chunk_text(text, chunk_size=8, overlap=0))
+    assert chunk == "aaaa. "
+
+def test_chunk_without_boundary_in_second_half_is_cut_at_size():
+    text = "a" * 25
+    assert [chunk for _, _, chunk in chunk_text(text, chunk_size=10, overlap=0)] == [
+        "a" * 10, "a" * 10, "a" * 5
+    ]
+
+def test_short_and_empty_text():
+    assert list(chunk_text("hello", chunk_size=100, overlap=20)) == [(0, 5, "hello")]
+    assert list(chunk_text("", chunk_size=100, overlap=20)) == []
+
+def test_file_extension():
+    assert file_extension("Report.PDF") == "pdf"
+    assert file_extension("archive.tar.json") == "json"
+    assert file_extension("README") == ""
\ No newline at end of file
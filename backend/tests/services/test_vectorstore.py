@@ -0,0 +1,65 @@
+# test_vectorstore.py
+import asyncio
+import numpy as np
+import pytest
+import pytest_asyncio
+from backend.services import vectorstore
+from backend.services.vectorstore import EmbeddingBatcher, mmr_select
+
+@pytest_asyncio.fixture
+async def batcher():
+    batcher = EmbeddingBatcher(max_wait=0.01)
+    yield batcher
+    # Stop the collector task before the test's event loop closes
+    if batcher._worker is not None:
+        batcher._worker.cancel()
+        await asyncio.gather(batcher._worker, return_exceptions=True)
+
+def test_mmr_returns_all_when_fewer_than_k():
+    assert mmr_select([1, 0], [[1, 0], [0, 1]], k=3) == [0, 1]
+
+def test_mmr_prefers_diverse_candidates():
+    query = [1.0, 0.0]
+    near_duplicate = [0.99, 0.141]
+    embeddings = np.asarray([
+        [1.0, 0.0],
+        near_duplicate,
+        [0.6, 0.8],
+    ])
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # Pure relevance would pick the near-duplicate second
+    assert mmr_select(query, embeddings, k=2, lambda_mult=0.3) == [0, 2]
+    assert mmr_select(query, embeddings, k=2, lambda_mult=1.0) == [0, 1]
+
+@pytest.mark.asyncio
+async def test_batcher_coalesces_concurrent_requests(monkeypatch, batcher):
+    calls = []
+
+    async def fake_embed_batch(texts, semaphore):
+        calls.append(list(texts))
+        return np.asarray([[float(i), 1.0] for i in range(len(texts))], dtype=np.float32)
+
+    monkeypatch.setattr(vectorstore, "_embed_batch_async", fake_embed_batch)
+    first, second = await asyncio.gather(batcher.embed("a"), batcher.embed("b"))
+    assert calls == [["a", "b"]]
+    assert first.tolist() == [0.0, 1.0]
+    assert second.tolist() == [1.0, 1.0]
+
+@pytest.mark.asyncio
+async def test_batcher_resolves_callers_when_dispatch_fails(monkeypatch, batcher):
+    async def failing_embed_batch(texts, semaphore):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(vectorstore, "_embed_batch_async", failing_embed_batch)
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.embed("a"), batcher.embed("b")), timeout=1
+    )
+    assert results == [None, None]
+
+@pytest.mark.asyncio
+async def test_batcher_resolves_callers_when_batch_returns_none(monkeypatch, batcher):
+    async def failed_embed_batch(texts, semaphore):
+        return None
+
+    monkeypatch.setattr(vectorstore, "_embed_batch_async", failed_embed_batch)
+    assert await asyncio.wait_for(batcher.embed("a"), timeout=1) is None
\ No newline at end of file
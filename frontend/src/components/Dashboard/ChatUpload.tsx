@@ -43,7 +43,7 @@ const ChatUpload: React.FC = () => {
 
   const addFiles = (newFiles: File[]) => {
     const validFiles = newFiles.filter(file => {
-      const validTypes = ['text/plain', 'application/json', 'text/csv'];
+      const validTypes = ['text/plain', 'application/json'];
       return validTypes.includes(file.type) && file.size <= 10 * 1024 * 1024; // 10MB limit
     });
 
@@ -122,7 +122,7 @@ const ChatUpload: React.FC = () => {
       <div className="bg-white rounded-lg shadow-sm border p-6">
         <h2 className="text-xl font-semibold text-gray-900 mb-4">Upload Chat Files</h2>
         <p className="text-gray-600 mb-6">
-          Upload chat exports from Discord, Slack, WhatsApp, or other platforms. Supports TXT, JSON, and CSV files.
+          Upload chat exports from Discord, Slack, WhatsApp, or other platforms. Supports TXT and JSON files.
         </p>
 
         {/* Platform Instructions */}
@@ -152,13 +152,13 @@ const ChatUpload: React.FC = () => {
             Drop chat files here or click to browse
           </h3>
           <p className="text-gray-500 mb-4">
-            Supports TXT, JSON, and CSV files up to 10MB
+            Supports TXT and JSON files up to 10MB
           </p>
           <input
             ref={fileInputRef}
             type="file"
             multiple
-            accept=".txt,.json,.csv"
+            accept=".txt,.json"
             onChange={handleFileSelect}
             className="hidden"
           />